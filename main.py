@@ -1,24 +1,49 @@
 # Standard library imports
-from io import BytesIO
 import datetime
 import hashlib
 import json
 import logging
+import mmap
 import os
 from pathlib import Path
 import zipfile
 import base64
 import importlib.util
+from typing import Optional
+import xml.etree.ElementTree as ElementTree
 
 # Third-party imports
-from bs4 import BeautifulSoup
 from syftbox.lib import Client, SyftPermission
-import diffprivlib.tools as dp
 import numpy as np
 import pandas as pd
 import tenseal as ts
 import yaml
 
+# lxml is the faster parser, the standard library one is used when it isn't installed
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# pyarrow converts the parsed columns faster, pandas is used when it isn't installed
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+# blake3 hashes large files on all cores, SHA-256 is used when it isn't installed
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# orjson serializes the exported results faster, pandas is used when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Local imports
 from config import *
 
@@ -29,10 +54,33 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# Hash algorithm recorded with the last run hash
+HASH_ALGORITHM = 'sha256' if blake3 is None else 'blake3'
+
+# Exports larger than this (in bytes) are memory-mapped to be hashed with SHA-256
+MMAP_THRESHOLD = 100 * 1024 * 1024
+
+# Number of cleaned exports kept in the parquet cache
+CACHE_SIZE = 2
+# Bump when clean_up_df or build_dataframe change the cached frames
+CACHE_VERSION = 1
+
+# Record attributes to load, keyed by their dataframe column name
+RECORD_ATTRIBUTES = {
+    'type': 'type',
+    'source_name': 'sourceName',
+    'source_version': 'sourceVersion',
+    'unit': 'unit',
+    'value': 'value',
+    'creation_date': 'creationDate',
+    'start_date': 'startDate',
+    'end_date': 'endDate'
+}
+
 
 def calculate_file_hash(filepath: str) -> str:
     """
-    Calculate SHA-256 hash of a file
+    Calculate the HASH_ALGORITHM (BLAKE3 or SHA-256) hash of a file
 
     Args:
         filepath (str): Path to the file to hash
@@ -40,59 +88,101 @@ def calculate_file_hash(filepath: str) -> str:
     Returns:
         str: Hexadecimal string of the hash
     """
-    sha256_hash = hashlib.sha256()
-
-    with open(filepath, 'rb') as f:
-        # Read the file in chunks to handle large files efficiently
-        for chunk in iter(lambda: f.read(4096), b''):
-            sha256_hash.update(chunk)
+    if blake3 is not None:
+        blake3_hash = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        blake3_hash.update_mmap(filepath)
+        return blake3_hash.hexdigest()
+
+    with open(filepath, 'rb', buffering=0) as f:
+        # Hash large files memory-mapped in one call, without copying them through
+        # userspace. The export must not be rewritten meanwhile (SIGBUS on truncation),
+        # so smaller files take the read-based path below
+        if os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest()
+
+        # file_digest (Python 3.11+) runs the read/update loop in C
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+        # Fallback: read the file in large chunks into a reusable buffer
+        sha256_hash = hashlib.sha256()
+        buffer = bytearray(1 << 20)
+        view = memoryview(buffer)
+        while (size := f.readinto(buffer)):
+            sha256_hash.update(view[:size])
 
     return sha256_hash.hexdigest()
 
 
-def should_run(filepath: str) -> bool:
+def should_run(filepath: str,
+               parameters: dict) -> tuple[bool, Optional[str], os.stat_result]:
     '''
-    Check whether current file on filepath hash is the same with the one last recorded
+    Check whether current file on filepath hash and the parameters are the same with
+    the ones last recorded
+
+    The file size and modification time are compared first, so an unchanged
+    export is not hashed at all. The hash stays authoritative when they differ.
 
     Args:
         filepath (str): Path to the file to check
+        parameters (dict): Run parameters (type, epsilon, bounds)
 
     Returns:
-        bool: True if file has changed or no previous hash exists, False otherwise
+        tuple[bool, Optional[str], os.stat_result]: True if file or parameters have
+            changed or no previous hash exists, False otherwise, along with the current file hash
+            (None if it was not needed) and the file stats taken before hashing it
     '''
     hashes_file = f"./hashes/{API_NAME}_last_run"
 
-    # Calculate current file hash
-    current_hash = calculate_file_hash(filepath)
+    # Taken before hashing, so a file replaced afterwards never matches the record
+    stat = os.stat(filepath)
 
     if DEVELOPMENT:
-        return True
+        return True, calculate_file_hash(filepath), stat
 
     # If hashes directory or file doesn't exist, we should run
     if not os.path.exists(hashes_file):
-        return True
+        return True, calculate_file_hash(filepath), stat
 
     try:
         with open(hashes_file, 'r') as f:
-            stored_hash = json.load(f).get('hash')
+            stored = json.load(f)
 
-        # Return True if hashes are different (file has changed)
-        return current_hash != stored_hash
+        # Changed parameters (e.g. epsilon) rerun on the same file, from the cached records
+        if stored.get('parameters') != parameters:
+            return True, calculate_file_hash(filepath), stat
 
-    except (json.JSONDecodeError, KeyError):
+        # Same size and modification time, the file has not changed
+        if (stored.get('size') == stat.st_size
+                and stored.get('mtime_ns') == stat.st_mtime_ns):
+            return False, None, stat
+
+        # Hashes from another algorithm (older records are SHA-256) never match
+        current_hash = calculate_file_hash(filepath)
+        if (current_hash == stored.get('hash')
+                and stored.get('algorithm', 'sha256') == HASH_ALGORITHM):
+            # Touched but not modified, refresh the stored stats for next time
+            record_filehash(current_hash, stat, parameters)
+            return False, current_hash, stat
+
+        return True, current_hash, stat
+
+    except (json.JSONDecodeError, KeyError, AttributeError):
         # If there's any error reading the hash, we should run to be safe
-        return True
+        return True, calculate_file_hash(filepath), stat
 
 
-def record_filehash(filepath: str) -> None:
+def record_filehash(current_hash: str, stat: os.stat_result, parameters: dict) -> None:
     '''
-    Store the current filepath hash 
+    Store the file hash, size and modification time, and the run parameters
 
     Args:
-        filepath (str): Path to the file whose hash should be stored
+        current_hash (str): Hash of the file, as returned by calculate_file_hash
+        stat (os.stat_result): Stats of the file, taken before it was hashed
+        parameters (dict): Run parameters (type, epsilon, bounds)
     '''
     hashes_file = f"./hashes/{API_NAME}_last_run"
-    current_hash = calculate_file_hash(filepath)
 
     # Create hashes directory if it doesn't exist
     os.makedirs(os.path.dirname(hashes_file), exist_ok=True)
@@ -100,6 +190,10 @@ def record_filehash(filepath: str) -> None:
     # Store hash in JSON format with timestamp for debugging purposes
     hash_data = {
         'hash': current_hash,
+        'algorithm': HASH_ALGORITHM,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'parameters': parameters,
         'timestamp': datetime.datetime.now().isoformat()
     }
 
@@ -107,6 +201,80 @@ def record_filehash(filepath: str) -> None:
         json.dump(hash_data, f, indent=2)
 
 
+def cache_filepath(cache_dir: Path, current_hash: str, type_parameter: str) -> Path:
+    '''
+    Path of the cached cleaned records of an export
+
+    Args:
+        cache_dir (Path): Cache folder, within the private datasite folder
+        current_hash (str): Hash of the export file, as returned by calculate_file_hash
+        type_parameter (str): Record type the records were filtered on
+
+    Returns:
+        Path: Parquet file, versioned so frames cached by older code are never loaded
+    '''
+    return cache_dir / f"v{CACHE_VERSION}_{current_hash}_{type_parameter}.parquet"
+
+
+def load_cached_df(cache_dir: Path, current_hash: str,
+                   type_parameter: str) -> Optional[pd.DataFrame]:
+    '''
+    Load the cleaned records of a previous run on the same export, if cached
+
+    Args:
+        cache_dir (Path): Cache folder, within the private datasite folder
+        current_hash (str): Hash of the export file, as returned by calculate_file_hash
+        type_parameter (str): Record type the records were filtered on
+
+    Returns:
+        Optional[pd.DataFrame]: Cleaned records, or None if there is no usable cache
+    '''
+    cache_file = cache_filepath(cache_dir, current_hash, type_parameter)
+
+    if pa is None or not cache_file.exists():
+        return None
+
+    try:
+        df = pd.read_parquet(cache_file)
+    except (OSError, pa.ArrowException):
+        # A broken cache is just reparsed and overwritten
+        return None
+
+    # Mark as recently used, see cache_df
+    os.utime(cache_file)
+    return df
+
+
+def cache_df(df: pd.DataFrame, cache_dir: Path, current_hash: str,
+             type_parameter: str) -> None:
+    '''
+    Cache the cleaned records of the export, keeping only the most recently used files
+
+    Args:
+        df (pd.DataFrame): Cleaned records, as returned by clean_up_df
+        cache_dir (Path): Cache folder, within the private datasite folder
+        current_hash (str): Hash of the export file, as returned by calculate_file_hash
+        type_parameter (str): Record type the records were filtered on
+    '''
+    if pa is None:
+        return
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(cache_filepath(cache_dir, current_hash, type_parameter))
+    except (OSError, pa.ArrowException) as e:
+        # The cache is only a speedup, the results can still be published
+        logger.warning(f"Failed to cache the cleaned records: {str(e)}")
+        return
+
+    # Evict the least recently used files (and older versions), older exports are
+    # unlikely to come back
+    cached_files = sorted(cache_dir.glob('*.parquet'),
+                          key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in cached_files[CACHE_SIZE:]:
+        path.unlink(missing_ok=True)
+
+
 def validate_config(config):
     """
     Validate essential configuration parameters.
@@ -221,108 +389,289 @@ def create_private_folder(filepath: Path, client: Client) -> Path:
     return path
 
 
-def convert_record_to_dict(record):
-    data = {
-        'type': record.get('type'),
-        'source_name': record.get('sourceName'),
-        'source_version': record.get('sourceVersion'),
-        'unit': record.get('unit'),
-        'value': record.get('value'),
-        'creation_date': record.get('creationDate'),
-        'start_date': record.get('startDate'),
-        'end_date': record.get('endDate')
-    }
+def iter_records(source, type_parameter=None):
+    """
+    Stream the Record elements of an Apple Health export.
+
+    Elements are cleared once consumed so memory stays flat regardless of export size.
+    Records of other types are dropped inside the parsing loop, without being yielded.
+
+    Args:
+        source: Path or binary file object of the export.xml
+        type_parameter (str): Record type to keep, all records if None
+
+    Yields:
+        Element: Each kept Record element, valid until the next one is requested
+    """
+    if etree is not None:
+        # Recover from malformed exports (e.g. the broken DTD of some iOS versions)
+        # like the previous BeautifulSoup parser did, and allow multi-GB trees
+        context = etree.iterparse(source, events=('end',), tag='Record',
+                                  recover=True, huge_tree=True)
+        for _, record in context:
+            if type_parameter is None or record.get('type') == type_parameter:
+                yield record
+
+            # Free the parsed element and any already processed siblings
+            record.clear()
+            while record.getprevious() is not None:
+                del record.getparent()[0]
+
+    else:
+        context = ElementTree.iterparse(source, events=('start', 'end'))
+        _, root = next(context)
 
-    return data
+        for event, element in context:
+            if event != 'end' or element.tag != 'Record':
+                continue
+
+            if type_parameter is None or element.get('type') == type_parameter:
+                yield element
+
+            # Records are direct children of the root, drop everything parsed so far
+            root.clear()
+
+
+def parse_records(source, type_parameter=None):
+    """
+    Read the attributes of the Record elements of an Apple Health export.
+
+    Args:
+        source: Path or binary file object of the export.xml
+        type_parameter (str): Record type to keep, all records if None
+
+    Returns:
+        dict: Column name to list of attribute values of the kept records
+    """
+    columns = {column: [] for column in RECORD_ATTRIBUTES}
+    appends = [(columns[column].append, attribute)
+               for column, attribute in RECORD_ATTRIBUTES.items()]
+
+    for record in iter_records(source, type_parameter):
+        for append, attribute in appends:
+            append(record.get(attribute))
+
+    return columns
 
 
 def read_apple_health(filepath, type_parameter=None):
     logger.info("Loading health records ...")
 
-    if filepath.endswith('.zip'):
-        logger.info("Unzipping the file")
-        with open(filepath, 'rb') as f:
-            data = f.read()
+    try:
+        if filepath.endswith('.zip'):
+            logger.info("Unzipping the file")
+            # Records are parsed while the export is being decompressed, without buffering it
+            with zipfile.ZipFile(filepath) as zip_ref, \
+                    zip_ref.open('apple_health_export/export.xml') as f:
+                columns = parse_records(f, type_parameter)
+        else:
+            columns = parse_records(filepath, type_parameter)
 
-        with zipfile.ZipFile(BytesIO(data)) as zip_ref:
-            with zip_ref.open('apple_health_export/export.xml') as f:
-                file_content = f.read()
-    else:
-        with open(filepath, 'r') as f:
-            file_content = f.read()
+    except ElementTree.ParseError as e:
+        # Only raised by the standard library parser, which can't recover like lxml
+        logger.error(
+            f"Failed to parse the export: {str(e)}. Install lxml (pip install lxml) "
+            "to load exports with a malformed structure.")
+        return None
 
-    if not file_content:
-        logger.error("No export file found named")
+    logger.info("Corresponding health records loaded and parsed")
+    # Create the initial dataframe from the XML file, and perform cleansing / preparation
 
-    soup = BeautifulSoup(file_content, features='xml')
-    records = soup.find_all("Record")
+    return build_dataframe(columns)
 
-    data_list = []
-    if type_parameter:
-        for record in records:
-            if record.get("type") == type_parameter:
-                data_list.append(convert_record_to_dict(record))
+
+def build_dataframe(columns):
+    """
+    Create the typed dataframe of the parsed records.
+
+    Args:
+        columns (dict): Column name to list of attribute values, as returned by parse_records
+
+    Returns:
+        pd.DataFrame: Records with numeric values, UTC datetimes and the local end day as 'date'
+    """
+    # Columns that should be converted to datetime
+    datetime_columns = ['creation_date', 'start_date', 'end_date']
+    # Apple Health always writes dates in this format, e.g. 2022-01-01 10:00:00 +0700
+    datetime_format = "%Y-%m-%d %H:%M:%S %z"
+
+    # Use end date (local day, as written in the export) as the comparison date,
+    # kept as datetime for fast grouping. Offsets may differ between records
+    # (e.g. travelling), so the datetime columns are all stored as UTC
+    if pa is None:
+        # Object columns keep the string accessor usable when no record matched
+        df = pd.DataFrame(columns, dtype=object)
+
+        df['date'] = pd.to_datetime(
+            df['end_date'].str[:10], format="%Y-%m-%d", errors='coerce')
+
+        for column in datetime_columns:
+            df[column] = pd.to_datetime(
+                df[column], format=datetime_format, errors='coerce', utc=True)
 
     else:
-        for record in records:
-            data_list.append(convert_record_to_dict(record))
+        # Parse the strings straight into typed columnar arrays
+        arrays = {column: pa.array(values, pa.string())
+                  for column, values in columns.items()}
 
-    logger.info("Corresponding health records loaded and parsed")
-    # Create the initial dataframe from the XML file, and perform cleansing / preparation
+        arrays['date'] = pc.strptime(
+            pc.utf8_slice_codeunits(arrays['end_date'], 0, 10),
+            format="%Y-%m-%d", unit='s', error_is_null=True)
+
+        for column in datetime_columns:
+            arrays[column] = pc.strptime(
+                arrays[column], format=datetime_format, unit='us', error_is_null=True)
 
-    return pd.DataFrame(data_list)
+        df = pa.table(arrays).to_pandas(split_blocks=True, self_destruct=True)
+
+    df['value'] = pd.to_numeric(df['value'], errors='coerce')
+
+    return df
 
 
 def clean_up_df(df):
     logger.info("Some data cleanup...")
 
-    # Columns that should be converted to float
-    float_columns = ['value']
-    # Columns that should be converted to datetime
-    datetime_columns = ['creation_date', 'start_date', 'end_date']
+    # Let's filter some date and the unparseable values, only the date and value
+    # are needed from here on
+    keep = (df['date'] >= pd.Timestamp('2022-01-01')) & df['value'].notna()
+    df = df.loc[keep, ['date', 'value']]
 
-    df = df.copy()
+    # Step counts are integers, store them in half the bytes when they all fit
+    values = df['value']
+    int32 = np.iinfo(np.int32)
+    if ((values % 1 == 0).all()
+            and values.between(int32.min, int32.max).all()):
+        df['value'] = values.astype(np.int32)
 
-    df[float_columns] = df[float_columns].apply(
-        pd.to_numeric, errors='coerce')
-    df[datetime_columns] = df[datetime_columns].apply(
-        pd.to_datetime, errors='coerce')
+    return df
 
-    # Use end date as the comparison date
-    df['date'] = df['end_date'].dt.strftime("%Y-%m-%d")
 
-    # Let's filter some date
-    return df[df['date'] >= '2022-01-01']
+def secure_uniform(size):
+    """
+    Draw uniform floats in [0, 1) from the OS entropy source, like secrets.SystemRandom.
 
+    Args:
+        size (int): Number of draws
+
+    Returns:
+        np.ndarray: Uniform draws with 53 random bits each
+    """
+    bits = np.frombuffer(os.urandom(8 * size), dtype=np.uint64) >> np.uint64(11)
+    return bits * 2.0 ** -53
 
-def create_dp(df, epsilon, bounds_config):
+
+def geometric_noise(epsilon, sensitivity):
+    """
+    Draw two-sided geometric noise, the integer Laplace mechanism used by diffprivlib.
+
+    Uses the inverse CDF of diffprivlib's Geometric mechanism, on uniforms drawn from
+    OS entropy as diffprivlib does by default.
+
+    Args:
+        epsilon (float): Privacy budget of each draw
+        sensitivity (np.ndarray): Sensitivity of each value to randomise
+
+    Returns:
+        np.ndarray: Integer noise, one draw per sensitivity
+    """
+    sensitivity = np.asarray(sensitivity)
+
+    # A zero sensitivity gives an infinite scale, where the noise is always 0
+    with np.errstate(divide='ignore'):
+        scale = np.where(sensitivity > 0, -epsilon / sensitivity, -np.inf)
+
+    # Account for the overlap of the 0 value between both signs
+    unif_rv = (secure_uniform(sensitivity.size) - 0.5) * (1 + np.exp(scale))
+    sgn = np.where(unif_rv < 0, -1, 1)
+
+    with np.errstate(divide='ignore'):
+        noise = sgn * np.floor(np.log(sgn * unif_rv) / scale)
+
+    return noise.astype(np.int64)
+
+
+def aggregate_daily(df):
+    """
+    Aggregate the records per date, for both the summary and the DP inputs.
+
+    Everything is computed in a single groupby pass over the non-NaN values, so the
+    counts match the rows the sums and maxima are taken over. The clipped sum clips
+    the values to the lower bound like dp.sum does.
+
+    Args:
+        df (pd.DataFrame): Cleaned records, as returned by clean_up_df
+
+    Returns:
+        pd.DataFrame: One row per date, sorted by date
+    """
+    df = df[df['value'].notna()]
+
+    return pd.DataFrame({
+        'date': df['date'],
+        'value': df['value'],
+        'clipped': df['value'].clip(lower=1),
+        'nonzero': df['value'] != 0
+    }).groupby('date').agg(
+        step_count=('value', 'sum'),
+        step_entries=('value', 'count'),
+        clipped_sum=('clipped', 'sum'),
+        nz=('nonzero', 'sum'),
+        hi=('value', 'max'),
+        n=('value', 'size')
+    ).reset_index()
+
+
+def create_dp(agg, epsilon, bounds_config):
 
     logger.info("Generating differentially private health records ...")
 
+    if bounds_config != 'auto-local':
+        raise ValueError(f"Unsupported bounds: {bounds_config}")
+
+    # The bounds (1, max) are invalid when the max is below 1, dp.sum raised there
+    invalid = agg['hi'] < 1
+    if invalid.any():
+        logger.warning(
+            f"Skipping {invalid.sum()} date(s) without any value of at least 1")
+        agg = agg[~invalid]
+
+    sums = agg['clipped_sum'].to_numpy(dtype=np.int64)
+    nz = agg['nz'].to_numpy(dtype=np.int64)
+    hi = agg['hi'].to_numpy(dtype=np.int64)
+    n = agg['n'].to_numpy(dtype=np.int64)
+
+    # Same mechanisms as dp.sum with bounds (1, max) and dp.count_nonzero, drawn in one
+    # vector per output and truncated to the reachable range
+    dp_step_count = sums + geometric_noise(epsilon, hi - 1)
+    dp_step_entries = nz + geometric_noise(epsilon, np.ones_like(n))
+
     # Create the differentially private dataframe
-    dp_df = []
+    return pd.DataFrame({
+        'date': agg['date'],
+        'dp_step_count': np.clip(dp_step_count, n, n * hi),
+        'dp_step_entries': np.clip(dp_step_entries, 0, n)
+    })
+
 
-    for date in df['date'].unique():
-        record_values = df[df['date'] == date]['value']
+def export_json(df, filepath):
+    """
+    Write the per-date rows of a dataframe as a JSON object keyed by date.
 
-        if bounds_config == 'auto-local':
-            bounds = (1, record_values.max())
+    Args:
+        df (pd.DataFrame): Dataframe with a 'date' column
+        filepath: Path of the JSON file to write
+    """
+    df = df.set_index("date").T
 
-        dp_df.append({
-            'date': date,
-            'dp_step_count': dp.sum(
-                record_values,
-                epsilon=epsilon,
-                bounds=bounds,
-                dtype=int
-            ),
-            'dp_step_entries': dp.count_nonzero(
-                record_values,
-                epsilon=epsilon,
-            )
-        })
+    if orjson is None:
+        df.to_json(filepath)
+        return
 
-    return pd.DataFrame(dp_df)
+    # Same output as to_json: the transposed per-date columns share a single dtype
+    # (floats when any value is), and floats are rounded to its double_precision=10
+    Path(filepath).write_bytes(orjson.dumps(
+        df.round(10).to_dict(), option=orjson.OPT_SERIALIZE_NUMPY))
 
 
 def setup_datasites():
@@ -347,33 +696,53 @@ if __name__ == '__main__':
     logger = logging.getLogger(__name__)
     logger.info("Started health steps counter")
 
-    if check_config() and should_run(FILEPATH):
+    if not check_config():
+        exit(0)
+
+    # The hash and stats taken by the check are reused when recording the run
+    run, current_hash, stat = should_run(FILEPATH, PARAMETERS)
+
+    if run:
 
         type_parameter = PARAMETERS['type']
         epsilon = PARAMETERS['epsilon']
         bounds_config = PARAMETERS['bounds']
 
-        df = read_apple_health(FILEPATH, type_parameter)
-        df = clean_up_df(df)
+        public_file, private_file = setup_datasites()
 
-        dp_df = create_dp(df, epsilon, bounds_config)
+        # The cleaned records are private data, cache them next to the private results
+        cache_dir = private_file.parent / "cache"
 
-        summary_df = df.groupby('date')['value'].agg(
-            ['sum', 'count']).reset_index()
-        summary_df.columns = ['date', 'step_count', 'step_entries']
+        # Skip parsing when the same export was already processed (e.g. epsilon changed)
+        df = load_cached_df(cache_dir, current_hash, type_parameter)
+        if df is None:
+            df = read_apple_health(FILEPATH, type_parameter)
+            if df is None:
+                exit(1)
 
-        public_file, private_file = setup_datasites()
+            df = clean_up_df(df)
+            cache_df(df, cache_dir, current_hash, type_parameter)
+
+        agg = aggregate_daily(df)
+
+        dp_df = create_dp(agg, epsilon, bounds_config)
+
+        summary_df = agg[['date', 'step_count', 'step_entries']].copy()
+
+        # Dates are only formatted once aggregated, for the exported JSON keys
+        summary_df['date'] = summary_df['date'].dt.strftime("%Y-%m-%d")
+        dp_df['date'] = dp_df['date'].dt.strftime("%Y-%m-%d")
 
         if DEVELOPMENT:
-            summary_df.set_index("date").T.to_json("daily_steps.json")
-            dp_df.set_index("date").T.to_json("dp_daily_steps.json")
+            export_json(summary_df, "daily_steps.json")
+            export_json(dp_df, "dp_daily_steps.json")
         else:
-            summary_df.set_index("date").T.to_json(private_file)
-            dp_df.set_index("date").T.to_json(public_file)
+            export_json(summary_df, private_file)
+            export_json(dp_df, public_file)
 
         logger.info("Exported the results")
 
-        record_filehash(FILEPATH)
+        record_filehash(current_hash, stat, PARAMETERS)
         logger.info("Updated record logs")
 
     else:
@@ -9,7 +9,7 @@ fi
 . .venv/bin/activate
 
 echo "Installing dependencies..."
-pip install -U syftbox diffprivlib psutil pandas bs4 lxml --quiet
+pip install -U syftbox psutil pandas lxml pyarrow blake3 orjson --quiet
 echo "Dependencies installed."
 
 echo "Running 'Health Steps Counter - Member' with $(python3 --version) at '$(which python3)'"
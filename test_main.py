@@ -0,0 +1,268 @@
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+import zipfile
+
+import numpy as np
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize('epsilon, sensitivity', [(0.5, 1), (0.5, 99), (2.0, 10)])
+def test_geometric_noise_matches_diffprivlib(epsilon, sensitivity):
+    GeometricTruncated = pytest.importorskip(
+        'diffprivlib.mechanisms').GeometricTruncated
+
+    draws = 20000
+    lower, upper = -10 * sensitivity, 10 * sensitivity
+    noise = main.geometric_noise(
+        epsilon, np.full(draws, sensitivity, dtype=np.int64))
+    ours = np.clip(noise, lower, upper)
+
+    mechanism = GeometricTruncated(
+        epsilon=epsilon, sensitivity=sensitivity, lower=lower, upper=upper,
+        random_state=1)
+    reference = np.array([mechanism.randomise(0) for _ in range(draws)])
+
+    assert abs(ours.mean() - reference.mean()) < 0.1 * reference.std()
+    assert ours.std() == pytest.approx(reference.std(), rel=0.05)
+
+
+def test_geometric_noise_is_zero_without_sensitivity():
+    assert (main.geometric_noise(0.5, np.zeros(100, dtype=np.int64)) == 0).all()
+
+
+def test_create_dp_skips_dates_without_valid_bounds():
+    agg = main.aggregate_daily(main.pd.DataFrame({
+        'date': main.pd.to_datetime(['2022-01-01', '2022-01-01', '2022-01-02']),
+        'value': [0, 0, 100]
+    }))
+
+    dp_df = main.create_dp(agg, 1.0, 'auto-local')
+
+    assert list(dp_df['date']) == [main.pd.Timestamp('2022-01-02')]
+    assert (dp_df['dp_step_count'] >= 1).all()
+
+
+def test_aggregate_daily_ignores_nan_values():
+    agg = main.aggregate_daily(main.pd.DataFrame({
+        'date': main.pd.to_datetime(['2022-01-01'] * 3 + ['2022-01-02']),
+        'value': [10.0, np.nan, 30.0, np.nan]
+    }))
+
+    assert list(agg['date']) == [main.pd.Timestamp('2022-01-01')]
+    assert agg.loc[0, ['step_count', 'step_entries', 'hi', 'n']].tolist() == [40, 2, 30, 2]
+
+
+MALFORMED_DTD_EXPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ATTLIST Record
+  type CDATA #REQUIRED
+  value CDATA #IMPLIED
+<!ELEMENT HealthData (Record*)>
+]>
+<HealthData locale="en_US">
+ <Record type="HKQuantityTypeIdentifierStepCount" value="5"/>
+ <Record type="HKQuantityTypeIdentifierHeartRate" value="60"/>
+ <Record type="HKQuantityTypeIdentifierStepCount" value="7"/>
+</HealthData>
+"""
+
+
+def test_parse_records_recovers_from_malformed_dtd():
+    pytest.importorskip('lxml')
+
+    columns = main.parse_records(
+        io.BytesIO(MALFORMED_DTD_EXPORT), 'HKQuantityTypeIdentifierStepCount')
+
+    assert columns['value'] == ['5', '7']
+
+
+def test_read_apple_health_reports_malformed_export_without_lxml(
+        tmp_path, monkeypatch, caplog):
+    export = tmp_path / 'export.xml'
+    export.write_bytes(MALFORMED_DTD_EXPORT)
+    monkeypatch.setattr(main, 'etree', None)
+
+    assert main.read_apple_health(str(export)) is None
+    assert 'Install lxml' in caplog.text
+
+
+STEPS_EXPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<HealthData locale="en_US">
+ <ExportDate value="2023-01-01 00:00:00 +0000"/>
+ <Record type="HKQuantityTypeIdentifierStepCount" sourceName="iPhone" sourceVersion="16.0" unit="count" creationDate="2022-01-01 10:05:00 +0700" startDate="2022-01-01 10:00:00 +0700" endDate="2022-01-01 10:05:00 +0700" value="120"/>
+ <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Watch" sourceVersion="9.0" unit="count/min" creationDate="2022-01-01 10:06:00 +0700" startDate="2022-01-01 10:06:00 +0700" endDate="2022-01-01 10:06:00 +0700" value="72.5"/>
+ <Record type="HKQuantityTypeIdentifierStepCount" sourceName="iPhone" sourceVersion="16.0" unit="count" creationDate="2022-01-02 00:30:00 +0700" startDate="2022-01-02 00:20:00 +0700" endDate="2022-01-02 00:30:00 +0700" value="80">
+  <MetadataEntry key="HKWasUserEntered" value="0"/>
+ </Record>
+ <Record type="HKQuantityTypeIdentifierStepCount" sourceName="Watch" sourceVersion="9.0" unit="count" creationDate="2022-01-02 09:00:00 -0500" startDate="2022-01-02 08:50:00 -0500" endDate="2022-01-02 09:00:00 -0500" value="0"/>
+ <Record type="HKQuantityTypeIdentifierStepCount" sourceName="iPhone" sourceVersion="15.0" unit="count" creationDate="2021-12-31 23:00:00 +0000" startDate="2021-12-31 22:50:00 +0000" endDate="2021-12-31 23:00:00 +0000" value="500"/>
+</HealthData>
+"""
+
+
+def test_changed_epsilon_reruns_from_the_cached_records(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.chdir(tmp_path)
+    export = tmp_path / 'export.xml'
+    export.write_bytes(STEPS_EXPORT)
+    cache_dir = tmp_path / 'cache'
+    parameters = dict(main.PARAMETERS)
+
+    run, current_hash, stat = main.should_run(str(export), parameters)
+    assert run
+    df = main.clean_up_df(main.read_apple_health(str(export), parameters['type']))
+    main.cache_df(df, cache_dir, current_hash, parameters['type'])
+    main.record_filehash(current_hash, stat, parameters)
+
+    assert main.should_run(str(export), parameters)[0] is False
+
+    parameters['epsilon'] = 1.0
+    run, rerun_hash, _ = main.should_run(str(export), parameters)
+    assert run and rerun_hash == current_hash
+
+    cached = main.load_cached_df(cache_dir, rerun_hash, parameters['type'])
+    assert cached is not None
+    assert cached['value'].tolist() == df['value'].tolist()
+
+
+def test_cache_df_write_failure_is_not_fatal(tmp_path, caplog):
+    pytest.importorskip('pyarrow')
+    # A file where the cache folder should be makes the write fail
+    cache_dir = tmp_path / 'cache'
+    cache_dir.write_text('')
+    df = main.pd.DataFrame({'date': main.pd.to_datetime(['2022-01-01']), 'value': [1]})
+
+    main.cache_df(df, cache_dir, 'hash', 'type')
+
+    assert 'Failed to cache' in caplog.text
+
+
+@pytest.fixture
+def export_files(tmp_path):
+    xml_path = tmp_path / 'export.xml'
+    xml_path.write_bytes(STEPS_EXPORT)
+
+    zip_path = tmp_path / 'export.zip'
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr('apple_health_export/export.xml', STEPS_EXPORT)
+
+    return [str(xml_path), str(zip_path)]
+
+
+@pytest.mark.parametrize('use_lxml', [True, False])
+@pytest.mark.parametrize('use_pyarrow', [True, False])
+def test_parsing_paths_give_the_same_records(export_files, monkeypatch,
+                                             use_lxml, use_pyarrow):
+    if use_lxml:
+        pytest.importorskip('lxml')
+    else:
+        monkeypatch.setattr(main, 'etree', None)
+    if use_pyarrow:
+        pytest.importorskip('pyarrow')
+    else:
+        monkeypatch.setattr(main, 'pa', None)
+
+    for filepath in export_files:
+        df = main.clean_up_df(main.read_apple_health(
+            filepath, 'HKQuantityTypeIdentifierStepCount'))
+
+        # Local days as written in the export, 2021 filtered out
+        assert df['date'].dt.strftime('%Y-%m-%d').tolist() == [
+            '2022-01-01', '2022-01-02', '2022-01-02']
+        assert df['value'].tolist() == [120, 80, 0]
+
+        agg = main.aggregate_daily(df)
+        assert agg[['step_count', 'step_entries', 'clipped_sum', 'nz', 'hi', 'n']] \
+            .values.tolist() == [[120, 1, 120, 1, 120, 1], [80, 2, 81, 1, 80, 2]]
+
+
+def test_parsing_keeps_all_record_types_without_type_parameter(export_files):
+    df = main.read_apple_health(export_files[0])
+
+    assert df['type'].tolist().count('HKQuantityTypeIdentifierHeartRate') == 1
+    assert len(df) == 5
+    # Datetime columns are stored as UTC
+    assert str(df['end_date'].iloc[0]) == '2022-01-01 03:05:00+00:00'
+
+
+@pytest.mark.parametrize('mmap_threshold', [0, 1 << 40])
+def test_calculate_file_hash_sha256(tmp_path, monkeypatch, mmap_threshold):
+    monkeypatch.setattr(main, 'blake3', None)
+    monkeypatch.setattr(main, 'MMAP_THRESHOLD', mmap_threshold)
+    export = tmp_path / 'export.xml'
+    export.write_bytes(STEPS_EXPORT)
+    empty = tmp_path / 'empty.xml'
+    empty.write_bytes(b'')
+
+    assert main.calculate_file_hash(str(export)) == hashlib.sha256(STEPS_EXPORT).hexdigest()
+    assert main.calculate_file_hash(str(empty)) == hashlib.sha256(b'').hexdigest()
+
+
+@pytest.fixture
+def recorded_export(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    export = tmp_path / 'export.xml'
+    export.write_bytes(STEPS_EXPORT)
+
+    run, current_hash, stat = main.should_run(str(export), main.PARAMETERS)
+    assert run and current_hash == main.calculate_file_hash(str(export))
+    main.record_filehash(current_hash, stat, main.PARAMETERS)
+
+    return export
+
+
+def test_should_run_skips_unchanged_file_without_hashing(recorded_export, monkeypatch):
+    def fail(filepath):
+        raise AssertionError('hashed an unchanged file')
+    monkeypatch.setattr(main, 'calculate_file_hash', fail)
+
+    assert main.should_run(str(recorded_export), main.PARAMETERS)[:2] == (False, None)
+
+
+def test_should_run_refreshes_stats_of_touched_file(recorded_export):
+    stat = recorded_export.stat()
+    os.utime(recorded_export, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    run, current_hash, _ = main.should_run(str(recorded_export), main.PARAMETERS)
+    assert not run and current_hash is not None
+
+    # The refreshed record matches on stats alone
+    assert main.should_run(str(recorded_export), main.PARAMETERS)[:2] == (False, None)
+
+
+def test_should_run_detects_modified_file(recorded_export):
+    recorded_export.write_bytes(STEPS_EXPORT.replace(b'value="120"', b'value="121"'))
+
+    assert main.should_run(str(recorded_export), main.PARAMETERS)[0]
+
+
+def test_should_run_treats_other_hash_algorithms_as_changed(recorded_export):
+    hashes_file = Path(f'hashes/{main.API_NAME}_last_run')
+    stored = json.loads(hashes_file.read_text())
+    stored.update(algorithm='other', size=None)
+    hashes_file.write_text(json.dumps(stored))
+
+    assert main.should_run(str(recorded_export), main.PARAMETERS)[0]
+
+
+def test_should_run_detects_file_replaced_during_the_run(recorded_export):
+    recorded_export.write_bytes(STEPS_EXPORT + b'\n')
+    run, current_hash, stat = main.should_run(str(recorded_export), main.PARAMETERS)
+    assert run
+
+    # Replaced while processing, the record keeps the stats of the hashed file
+    recorded_export.write_bytes(STEPS_EXPORT + b'\n\n')
+    main.record_filehash(current_hash, stat, main.PARAMETERS)
+
+    assert main.should_run(str(recorded_export), main.PARAMETERS)[0]
+
+
+def test_should_run_always_runs_in_development(recorded_export, monkeypatch):
+    monkeypatch.setattr(main, 'DEVELOPMENT', True)
+
+    assert main.should_run(str(recorded_export), main.PARAMETERS)[0]